@@ -3,82 +3,119 @@
 Download a subtitle using subliminal and convert SRT to VTT.
 Accepts JSON input and outputs VTT content.
 """
+import io
 import sys
 import json
 import re
-from babelfish import Language
-from subliminal import list_subtitles, download_subtitles, region
-from subliminal.video import Episode, Movie
+from functools import lru_cache
+from types import MappingProxyType
 
-# Configure cache
-region.configure('dogpile.cache.memory')
+# orjson is optional; fall back to the stdlib when it isn't installed
+try:
+    import orjson
+
+    _loads = orjson.loads
+
+    def _dumps(obj) -> str:
+        return orjson.dumps(obj).decode()
+except ImportError:
+    _loads, _dumps = json.loads, json.dumps
+
+# babelfish uses 3-letter ISO 639-2 codes
+# Map common 2-letter codes to 3-letter codes
+_LANG_MAP = MappingProxyType({
+    'en': 'eng', 'es': 'spa', 'fr': 'fra', 'de': 'deu', 'it': 'ita',
+    'pt': 'por', 'nl': 'nld', 'pl': 'pol', 'ru': 'rus', 'ja': 'jpn',
+    'ko': 'kor', 'zh': 'zho', 'ar': 'ara', 'he': 'heb', 'sv': 'swe',
+    'no': 'nor', 'da': 'dan', 'fi': 'fin', 'tr': 'tur', 'el': 'ell',
+    'hu': 'hun', 'cs': 'ces', 'ro': 'ron', 'th': 'tha', 'vi': 'vie',
+})
+
+# ASS timestamp: H:MM:SS.cc (centiseconds)
+_ASS_TS_RE = re.compile(r'(\d+):(\d{2}):(\d{2})\.(\d{2})')
+# Blank-line separator between SRT cue blocks
+_SRT_BLOCK_RE = re.compile(r'\n\n+')
+
+
+@lru_cache(maxsize=64)
+def _lang(code: str):
+    """Return the babelfish Language for a 2- or 3-letter code, defaulting to English."""
+    from babelfish import Language
+
+    try:
+        return Language(_LANG_MAP.get(code, code))
+    except Exception:
+        return Language('eng')
+
+
+def convert_timestamp(ts: str) -> str:
+    """Convert an ASS timestamp (H:MM:SS.cc) to VTT (HH:MM:SS.mmm)."""
+    match = _ASS_TS_RE.match(ts)
+    if match:
+        h, m, s, cs = match.groups()
+        return f"{int(h):02d}:{m}:{s}.{cs}0"
+    return ts
 
 
 def ass_to_vtt(ass_content: str) -> str:
     """Convert ASS/SSA subtitle format to WebVTT format."""
-    vtt_lines = ["WEBVTT", ""]
+    out = io.StringIO()
+    out.write("WEBVTT\n")
 
     in_events = False
-    format_line = None
+    field_indices = None
 
     for line in ass_content.split('\n'):
         line = line.strip()
 
-        if line.lower() == '[events]':
-            in_events = True
+        # Only lowercase the short keyword prefix, never the dialogue text
+        if line[:1] == '[':
+            if line.lower() == '[events]':
+                in_events = True
+                continue
+            elif in_events:
+                # New section, stop processing events
+                break
+
+        if not in_events:
             continue
-        elif line.startswith('[') and in_events:
-            # New section, stop processing events
-            break
-
-        if in_events:
-            if line.lower().startswith('format:'):
-                format_line = line[7:].strip().split(',')
-                format_line = [f.strip().lower() for f in format_line]
-            elif line.lower().startswith('dialogue:'):
-                if not format_line:
-                    continue
-
-                # Parse dialogue line
-                parts = line[9:].split(',', len(format_line) - 1)
-                if len(parts) < len(format_line):
-                    continue
-
-                dialogue = dict(zip(format_line, parts))
-
-                start = dialogue.get('start', '')
-                end = dialogue.get('end', '')
-                text = dialogue.get('text', '')
-
-                if not start or not end or not text:
-                    continue
-
-                # Convert ASS timestamp (H:MM:SS.cc) to VTT (HH:MM:SS.mmm)
-                def convert_timestamp(ts):
-                    # ASS format: H:MM:SS.cc (centiseconds)
-                    match = re.match(r'(\d+):(\d{2}):(\d{2})\.(\d{2})', ts)
-                    if match:
-                        h, m, s, cs = match.groups()
-                        return f"{int(h):02d}:{m}:{s}.{cs}0"
-                    return ts
-
-                vtt_start = convert_timestamp(start)
-                vtt_end = convert_timestamp(end)
-
-                # Preserve ASS styling tags - the frontend handles them for:
-                # - Positioning: {\an1} to {\an9} (numpad alignment)
-                # - Styling: {\i1}, {\b1}, {\u1} (italic, bold, underline)
-                # - Colors: {\c&HBBGGRR&} (primary color)
-                # The frontend will parse and render these appropriately.
-                # Only convert \N to actual newlines for VTT format.
-                text = text.replace('\\N', '\n').replace('\\n', '\n')
-
-                if text.strip():
-                    vtt_lines.append(f"{vtt_start} --> {vtt_end}")
-                    vtt_lines.append(text.strip())
-                    vtt_lines.append("")
 
-    return '\n'.join(vtt_lines)
+        if line[:7].lower() == 'format:':
+            format_line = [f.strip().lower() for f in line[7:].strip().split(',')]
+            columns = {name: i for i, name in enumerate(format_line)}
+            if 'start' in columns and 'end' in columns and 'text' in columns:
+                field_indices = (columns['start'], columns['end'], columns['text'], len(format_line) - 1)
+            else:
+                field_indices = None
+        elif line[:9].lower() == 'dialogue:':
+            if not field_indices:
+                continue
+
+            # Parse dialogue line - the final field (normally Text) keeps its commas
+            i_start, i_end, i_text, last = field_indices
+            parts = line[9:].split(',', last)
+            if len(parts) <= last:
+                continue
+
+            start = parts[i_start]
+            end = parts[i_end]
+            text = parts[i_text]
+
+            if not start or not end or not text:
+                continue
+
+            # Preserve ASS styling tags - the frontend handles them for:
+            # - Positioning: {\an1} to {\an9} (numpad alignment)
+            # - Styling: {\i1}, {\b1}, {\u1} (italic, bold, underline)
+            # - Colors: {\c&HBBGGRR&} (primary color)
+            # The frontend will parse and render these appropriately.
+            # Only convert \N to actual newlines for VTT format.
+            text = text.replace('\\N', '\n').replace('\\n', '\n').strip()
+
+            if text:
+                out.write(f"\n{convert_timestamp(start)} --> {convert_timestamp(end)}\n{text}\n")
+
+    return out.getvalue()
 
 
 def srt_to_vtt(srt_content: str) -> str:
@@ -89,8 +126,12 @@ def srt_to_vtt(srt_content: str) -> str:
     # Start with VTT header
     vtt_lines = ["WEBVTT", ""]
 
+    # Normalize CRLF so blank-line separators are found in Windows files too
+    if '\r' in srt_content:
+        srt_content = srt_content.replace('\r\n', '\n')
+
     # Split into subtitle blocks
-    blocks = re.split(r'\n\n+', srt_content.strip())
+    blocks = _SRT_BLOCK_RE.split(srt_content.strip())
 
     for block in blocks:
         lines = block.strip().split('\n')
@@ -143,13 +184,13 @@ def convert_to_vtt(content: str) -> str:
 
 def main():
     if len(sys.argv) < 2:
-        print(json.dumps({"error": "No input provided"}), file=sys.stderr)
+        print(_dumps({"error": "No input provided"}), file=sys.stderr)
         sys.exit(1)
 
     try:
-        params = json.loads(sys.argv[1])
+        params = _loads(sys.argv[1])
     except json.JSONDecodeError as e:
-        print(json.dumps({"error": f"Invalid JSON: {e}"}), file=sys.stderr)
+        print(_dumps({"error": f"Invalid JSON: {e}"}), file=sys.stderr)
         sys.exit(1)
 
     imdb_id = params.get("imdb_id", "")
@@ -166,9 +207,38 @@ def main():
     os_password = params.get("opensubtitles_password", "")
 
     if not subtitle_id or not provider:
-        print(json.dumps({"error": "subtitle_id and provider are required"}), file=sys.stderr)
+        print(_dumps({"error": "subtitle_id and provider are required"}), file=sys.stderr)
+        sys.exit(1)
+
+    # Build provider config
+    provider_configs = {}
+
+    # Validate provider - opensubtitles requires credentials
+    supported_providers = ['podnapisi', 'opensubtitles']
+    if provider not in supported_providers:
+        print(_dumps({"error": f"Provider '{provider}' not supported. Supported: {', '.join(supported_providers)}"}), file=sys.stderr)
         sys.exit(1)
 
+    if provider == 'opensubtitles':
+        if not os_username or not os_password:
+            print(_dumps({"error": "OpenSubtitles requires username and password"}), file=sys.stderr)
+            sys.exit(1)
+        provider_configs['opensubtitles'] = {
+            'username': os_username,
+            'password': os_password,
+        }
+
+    # subliminal/babelfish are slow to import, so defer them until the
+    # request has been validated and malformed invocations can fail fast
+    from subliminal import list_subtitles, download_subtitles, region
+    from subliminal.video import Episode, Movie
+
+    # Configure cache
+    region.configure('dogpile.cache.memory')
+
+    # Only pass real IMDb ids (tt...) through to subliminal
+    valid_imdb = imdb_id if imdb_id and imdb_id[:2] == "tt" else None
+
     # Determine if this is a TV show or movie
     if season is not None and episode is not None:
         video = Episode(
@@ -177,50 +247,17 @@ def main():
             season=int(season),
             episodes=[int(episode)],  # subliminal expects a list of episode numbers
             year=int(year) if year else None,
-            series_imdb_id=imdb_id if imdb_id and imdb_id.startswith("tt") else None,
+            series_imdb_id=valid_imdb,
         )
     else:
         video = Movie(
             name=title,
             title=title,
             year=int(year) if year else None,
-            imdb_id=imdb_id if imdb_id and imdb_id.startswith("tt") else None,
+            imdb_id=valid_imdb,
         )
 
-    # Parse language - babelfish uses 3-letter ISO 639-2 codes
-    # Map common 2-letter codes to 3-letter codes
-    lang_map = {
-        'en': 'eng', 'es': 'spa', 'fr': 'fra', 'de': 'deu', 'it': 'ita',
-        'pt': 'por', 'nl': 'nld', 'pl': 'pol', 'ru': 'rus', 'ja': 'jpn',
-        'ko': 'kor', 'zh': 'zho', 'ar': 'ara', 'he': 'heb', 'sv': 'swe',
-        'no': 'nor', 'da': 'dan', 'fi': 'fin', 'tr': 'tur', 'el': 'ell',
-        'hu': 'hun', 'cs': 'ces', 'ro': 'ron', 'th': 'tha', 'vi': 'vie',
-    }
-    lang_code = lang_map.get(language, language)
-    try:
-        lang = Language(lang_code)
-    except Exception:
-        lang = Language('eng')
-
-    languages = {lang}
-
-    # Build provider config
-    provider_configs = {}
-
-    # Validate provider - opensubtitles requires credentials
-    supported_providers = ['podnapisi', 'opensubtitles']
-    if provider not in supported_providers:
-        print(json.dumps({"error": f"Provider '{provider}' not supported. Supported: {', '.join(supported_providers)}"}), file=sys.stderr)
-        sys.exit(1)
-
-    if provider == 'opensubtitles':
-        if not os_username or not os_password:
-            print(json.dumps({"error": "OpenSubtitles requires username and password"}), file=sys.stderr)
-            sys.exit(1)
-        provider_configs['opensubtitles'] = {
-            'username': os_username,
-            'password': os_password,
-        }
+    languages = {_lang(language)}
 
     try:
         # Search for subtitles from the specific provider
@@ -229,13 +266,13 @@ def main():
         # Find the matching subtitle
         target_sub = None
         for sub in subtitles.get(video, []):
-            sub_id = getattr(sub, 'subtitle_id', None) or getattr(sub, 'id', str(hash(sub)))
-            if str(sub_id) == str(subtitle_id):
+            sub_id = getattr(sub, 'subtitle_id', None) or getattr(sub, 'id', None)
+            if sub_id and str(sub_id) == str(subtitle_id):
                 target_sub = sub
                 break
 
         if not target_sub:
-            print(json.dumps({"error": f"Subtitle not found: {subtitle_id}"}), file=sys.stderr)
+            print(_dumps({"error": f"Subtitle not found: {subtitle_id}"}), file=sys.stderr)
             sys.exit(1)
 
         # Download the subtitle
@@ -245,7 +282,7 @@ def main():
         content = target_sub.text or (target_sub.content.decode('utf-8', errors='replace') if target_sub.content else '')
 
         if not content:
-            print(json.dumps({"error": "Failed to download subtitle content. The provider may require authentication."}), file=sys.stderr)
+            print(_dumps({"error": "Failed to download subtitle content. The provider may require authentication."}), file=sys.stderr)
             sys.exit(1)
 
         # Convert to VTT
@@ -255,7 +292,7 @@ def main():
         print(vtt_content)
 
     except Exception as e:
-        print(json.dumps({"error": str(e)}), file=sys.stderr)
+        print(_dumps({"error": str(e)}), file=sys.stderr)
         sys.exit(1)
 
 
@@ -0,0 +1,196 @@
+package handlers
+
+import (
+	"bufio"
+	"context"
+	"fmt"
+	"io"
+	"log"
+	"os"
+	"os/exec"
+	"sync"
+	"time"
+)
+
+const (
+	// subtitleSearchTimeout bounds a single search; a worker that takes longer
+	// is assumed to be stuck and is restarted
+	subtitleSearchTimeout = 60 * time.Second
+	// subtitleSearchWorkers is how many searches can run at once; workers are
+	// only started when every running one is busy
+	subtitleSearchWorkers = 3
+)
+
+// subtitleSearchPool keeps a few `search_subtitles.py --serve` processes alive
+// so searches don't pay for starting Python and importing subliminal every
+// time, and so provider logins and the script's result cache survive between
+// searches. Each worker answers one request line with one response line, so a
+// worker handles a single search at a time.
+type subtitleSearchPool struct {
+	// command builds the worker process; tests swap in a stub script
+	command func() (*exec.Cmd, error)
+	timeout time.Duration
+
+	slots chan struct{}
+	mu    sync.Mutex
+	idle  []*subtitleSearchWorker
+}
+
+func newSubtitleSearchPool() *subtitleSearchPool {
+	return &subtitleSearchPool{
+		command: subtitleSearchCommand,
+		timeout: subtitleSearchTimeout,
+		slots:   make(chan struct{}, subtitleSearchWorkers),
+	}
+}
+
+func subtitleSearchCommand() (*exec.Cmd, error) {
+	scriptPath, pythonPath, err := getSubtitleScriptPaths("search_subtitles.py")
+	if err != nil {
+		return nil, err
+	}
+	return exec.Command(pythonPath, scriptPath, "--serve"), nil
+}
+
+// Search sends one JSON request to a free worker, starting it if needed, and
+// returns the worker's JSON response. It gives up when ctx is done, whether
+// it is still waiting for a worker or for the response.
+func (p *subtitleSearchPool) Search(ctx context.Context, paramsJSON []byte) ([]byte, error) {
+	select {
+	case p.slots <- struct{}{}:
+	case <-ctx.Done():
+		return nil, ctx.Err()
+	}
+
+	worker := p.acquire()
+	if worker.cmd == nil {
+		if err := worker.start(p.command); err != nil {
+			p.release(worker)
+			return nil, err
+		}
+	}
+
+	// The worker finishes the search even if the caller leaves, so it is only
+	// handed back once its response line has been read and the protocol is in
+	// sync again
+	done := make(chan searchResult, 1)
+	go func() {
+		res := worker.roundTrip(paramsJSON, p.timeout)
+		if res.err != nil {
+			// The worker died or hung, start a fresh one for the next search
+			worker.stop()
+		}
+		p.release(worker)
+		done <- res
+	}()
+
+	select {
+	case res := <-done:
+		return res.output, res.err
+	case <-ctx.Done():
+		return nil, ctx.Err()
+	}
+}
+
+// acquire takes the most recently used idle worker, or a new one if none is
+// idle; the caller must hold a slot
+func (p *subtitleSearchPool) acquire() *subtitleSearchWorker {
+	p.mu.Lock()
+	defer p.mu.Unlock()
+	if n := len(p.idle); n > 0 {
+		worker := p.idle[n-1]
+		p.idle = p.idle[:n-1]
+		return worker
+	}
+	return &subtitleSearchWorker{}
+}
+
+// release returns a worker to the pool and frees its slot
+func (p *subtitleSearchPool) release(worker *subtitleSearchWorker) {
+	p.mu.Lock()
+	p.idle = append(p.idle, worker)
+	p.mu.Unlock()
+	<-p.slots
+}
+
+type searchResult struct {
+	output []byte
+	err    error
+}
+
+// subtitleSearchWorker is one worker process; it is owned by whichever search
+// took it from the pool
+type subtitleSearchWorker struct {
+	cmd    *exec.Cmd
+	stdin  io.WriteCloser
+	stdout *bufio.Reader
+}
+
+// start launches the worker process
+func (w *subtitleSearchWorker) start(command func() (*exec.Cmd, error)) error {
+	cmd, err := command()
+	if err != nil {
+		return err
+	}
+
+	cmd.Stderr = os.Stderr
+	stdin, err := cmd.StdinPipe()
+	if err != nil {
+		return fmt.Errorf("failed to open subtitle worker stdin: %w", err)
+	}
+	stdout, err := cmd.StdoutPipe()
+	if err != nil {
+		return fmt.Errorf("failed to open subtitle worker stdout: %w", err)
+	}
+	if err := cmd.Start(); err != nil {
+		return fmt.Errorf("failed to start subtitle worker: %w", err)
+	}
+
+	log.Printf("[subtitles] Started search worker (pid %d)", cmd.Process.Pid)
+	w.cmd = cmd
+	w.stdin = stdin
+	w.stdout = bufio.NewReader(stdout)
+	return nil
+}
+
+// stop kills the worker process, if one is running
+func (w *subtitleSearchWorker) stop() {
+	if w.cmd == nil {
+		return
+	}
+	w.stdin.Close()
+	w.cmd.Process.Kill()
+	w.cmd.Wait()
+	w.cmd = nil
+	w.stdin = nil
+	w.stdout = nil
+}
+
+// roundTrip writes one request line and reads the response line, giving up
+// after timeout
+func (w *subtitleSearchWorker) roundTrip(paramsJSON []byte, timeout time.Duration) searchResult {
+	// The pipes are captured so a timed-out read can't touch a restarted worker
+	stdin, stdout := w.stdin, w.stdout
+	done := make(chan searchResult, 1)
+	go func() {
+		if _, err := stdin.Write(append(paramsJSON, '\n')); err != nil {
+			done <- searchResult{err: fmt.Errorf("failed to write to subtitle worker: %w", err)}
+			return
+		}
+		output, err := stdout.ReadBytes('\n')
+		if err != nil {
+			done <- searchResult{err: fmt.Errorf("failed to read from subtitle worker: %w", err)}
+			return
+		}
+		done <- searchResult{output: output}
+	}()
+
+	timer := time.NewTimer(timeout)
+	defer timer.Stop()
+	select {
+	case res := <-done:
+		return res
+	case <-timer.C:
+		return searchResult{err: fmt.Errorf("subtitle search timed out after %s", timeout)}
+	}
+}
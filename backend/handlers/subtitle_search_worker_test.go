@@ -0,0 +1,159 @@
+package handlers
+
+import (
+	"context"
+	"errors"
+	"os"
+	"os/exec"
+	"path/filepath"
+	"strings"
+	"sync"
+	"testing"
+	"time"
+)
+
+// stubSearchScript stands in for search_subtitles.py --serve: it answers each
+// request line with its own pid, so tests can tell whether a worker was reused
+// or restarted
+const stubSearchScript = `while IFS= read -r line; do
+	case "$line" in
+		*hang*) exec sleep 30 ;;
+		*exit*) exit 1 ;;
+		*slow*) sleep 0.3 ;;
+	esac
+	echo "[\"$$\"]"
+done
+`
+
+func newTestSearchPool(t *testing.T, timeout time.Duration) *subtitleSearchPool {
+	t.Helper()
+	script := filepath.Join(t.TempDir(), "search_stub.sh")
+	if err := os.WriteFile(script, []byte(stubSearchScript), 0o644); err != nil {
+		t.Fatalf("failed to write stub script: %v", err)
+	}
+
+	p := newSubtitleSearchPool()
+	p.timeout = timeout
+	p.command = func() (*exec.Cmd, error) {
+		return exec.Command("sh", script), nil
+	}
+	t.Cleanup(func() {
+		p.mu.Lock()
+		defer p.mu.Unlock()
+		for _, worker := range p.idle {
+			worker.stop()
+		}
+	})
+	return p
+}
+
+func searchStub(t *testing.T, p *subtitleSearchPool, request string) string {
+	t.Helper()
+	output, err := p.Search(context.Background(), []byte(`{"q":"`+request+`"}`))
+	if err != nil {
+		t.Fatalf("unexpected error: %v", err)
+	}
+	return strings.TrimSpace(string(output))
+}
+
+func TestSubtitleSearchPool_ReusesWorker(t *testing.T) {
+	p := newTestSearchPool(t, 5*time.Second)
+
+	first := searchStub(t, p, "a")
+	second := searchStub(t, p, "b")
+	if first != second {
+		t.Errorf("expected the worker to be reused, got %s then %s", first, second)
+	}
+}
+
+func TestSubtitleSearchPool_RestartsAfterExit(t *testing.T) {
+	p := newTestSearchPool(t, 5*time.Second)
+
+	first := searchStub(t, p, "a")
+	if _, err := p.Search(context.Background(), []byte(`{"q":"exit"}`)); err == nil {
+		t.Fatal("expected an error when the worker exits")
+	}
+	second := searchStub(t, p, "b")
+	if first == second {
+		t.Errorf("expected a new worker after exit, got %s again", second)
+	}
+}
+
+func TestSubtitleSearchPool_RestartsAfterTimeout(t *testing.T) {
+	p := newTestSearchPool(t, 200*time.Millisecond)
+
+	first := searchStub(t, p, "a")
+	_, err := p.Search(context.Background(), []byte(`{"q":"hang"}`))
+	if err == nil || !strings.Contains(err.Error(), "timed out") {
+		t.Fatalf("expected a timeout error, got %v", err)
+	}
+	second := searchStub(t, p, "b")
+	if first == second {
+		t.Errorf("expected a new worker after timeout, got %s again", second)
+	}
+}
+
+func TestSubtitleSearchPool_RunsSearchesConcurrently(t *testing.T) {
+	p := newTestSearchPool(t, 5*time.Second)
+
+	var wg sync.WaitGroup
+	pids := make([]string, 2)
+	start := time.Now()
+	for i := range pids {
+		wg.Add(1)
+		go func(i int) {
+			defer wg.Done()
+			pids[i] = searchStub(t, p, "slow")
+		}(i)
+	}
+	wg.Wait()
+
+	if pids[0] == pids[1] {
+		t.Errorf("expected two workers, both searches ran on %s", pids[0])
+	}
+	if elapsed := time.Since(start); elapsed > 550*time.Millisecond {
+		t.Errorf("expected searches to overlap, took %s", elapsed)
+	}
+}
+
+func TestSubtitleSearchPool_CancelWhileSearching(t *testing.T) {
+	p := newTestSearchPool(t, 500*time.Millisecond)
+
+	ctx, cancel := context.WithTimeout(context.Background(), 50*time.Millisecond)
+	defer cancel()
+	start := time.Now()
+	_, err := p.Search(ctx, []byte(`{"q":"hang"}`))
+	if !errors.Is(err, context.DeadlineExceeded) {
+		t.Fatalf("expected context.DeadlineExceeded, got %v", err)
+	}
+	if elapsed := time.Since(start); elapsed > 300*time.Millisecond {
+		t.Errorf("expected Search to return when the context ended, took %s", elapsed)
+	}
+
+	// The abandoned worker is restarted once its search times out
+	time.Sleep(600 * time.Millisecond)
+	searchStub(t, p, "a")
+}
+
+func TestSubtitleSearchPool_CancelWhileWaitingForWorker(t *testing.T) {
+	p := newTestSearchPool(t, time.Second)
+
+	// Occupy every worker
+	var wg sync.WaitGroup
+	for i := 0; i < subtitleSearchWorkers; i++ {
+		wg.Add(1)
+		go func() {
+			defer wg.Done()
+			p.Search(context.Background(), []byte(`{"q":"hang"}`))
+		}()
+	}
+	defer wg.Wait()
+	time.Sleep(100 * time.Millisecond)
+
+	ctx, cancel := context.WithTimeout(context.Background(), 50*time.Millisecond)
+	defer cancel()
+	_, err := p.Search(ctx, []byte(`{"q":"a"}`))
+	if !errors.Is(err, context.DeadlineExceeded) {
+		t.Fatalf("expected context.DeadlineExceeded, got %v", err)
+	}
+}
@@ -16,16 +16,17 @@ import (
 // SubtitlesHandler handles subtitle search and download requests
 type SubtitlesHandler struct {
 	configManager *config.Manager
+	searchPool    *subtitleSearchPool
 }
 
 // NewSubtitlesHandler creates a new SubtitlesHandler
 func NewSubtitlesHandler() *SubtitlesHandler {
-	return &SubtitlesHandler{}
+	return &SubtitlesHandler{searchPool: newSubtitleSearchPool()}
 }
 
 // NewSubtitlesHandlerWithConfig creates a new SubtitlesHandler with config manager
 func NewSubtitlesHandlerWithConfig(configManager *config.Manager) *SubtitlesHandler {
-	return &SubtitlesHandler{configManager: configManager}
+	return &SubtitlesHandler{configManager: configManager, searchPool: newSubtitleSearchPool()}
 }
 
 // getSubtitleScriptPaths returns paths to the subtitle Python scripts
@@ -128,23 +129,31 @@ func (h *SubtitlesHandler) Search(w http.ResponseWriter, r *http.Request) {
 		return
 	}
 
-	scriptPath, pythonPath, err := getSubtitleScriptPaths("search_subtitles.py")
+	output, err := h.searchPool.Search(r.Context(), paramsJSON)
 	if err != nil {
 		w.WriteHeader(http.StatusInternalServerError)
 		json.NewEncoder(w).Encode(map[string]string{"error": err.Error()})
 		return
 	}
 
-	cmd := exec.Command(pythonPath, scriptPath, string(paramsJSON))
-	output, err := cmd.Output()
-	if err != nil {
-		if exitErr, ok := err.(*exec.ExitError); ok {
+	// Results are a JSON array; failures come back as an object instead
+	if len(output) > 0 && output[0] == '{' {
+		var failure struct {
+			Error   string          `json:"error"`
+			Results json.RawMessage `json:"results"`
+		}
+		if err := json.Unmarshal(output, &failure); err != nil {
 			w.WriteHeader(http.StatusInternalServerError)
-			json.NewEncoder(w).Encode(map[string]string{"error": string(exitErr.Stderr)})
+			json.NewEncoder(w).Encode(map[string]string{"error": err.Error()})
+			return
+		}
+		// A provider failed, but the others' results are still worth showing
+		if failure.Error == "transient" && len(failure.Results) > 0 {
+			w.Write(failure.Results)
 			return
 		}
 		w.WriteHeader(http.StatusInternalServerError)
-		json.NewEncoder(w).Encode(map[string]string{"error": err.Error()})
+		json.NewEncoder(w).Encode(map[string]string{"error": failure.Error})
 		return
 	}
 
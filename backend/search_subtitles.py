@@ -2,74 +2,321 @@
 """
 Search for subtitles using subliminal.
 Accepts JSON input and outputs JSON array of subtitle results.
+
+Run with --serve to handle newline-delimited JSON requests on stdin instead.
 """
+import atexit
 import sys
+import heapq
 import json
-from babelfish import Language
-from subliminal import list_subtitles, region
-from subliminal.video import Episode, Movie
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import asdict, dataclass
+from functools import lru_cache
+from operator import attrgetter
+from types import MappingProxyType
 
-# Configure cache
-region.configure('dogpile.cache.memory')
+# orjson is optional; fall back to the stdlib when it isn't installed
+try:
+    import orjson
 
+    _loads = orjson.loads
+    _dumpb = orjson.dumps
+
+    def _dumps(obj) -> str:
+        return orjson.dumps(obj).decode()
+except ImportError:
+    _loads = json.loads
+
+    def _dumps(obj) -> str:
+        return json.dumps(obj, default=asdict)
+
+    def _dumpb(obj) -> bytes:
+        return _dumps(obj).encode()
+
+# babelfish uses 3-letter ISO 639-2 codes
+# Map common 2-letter codes to 3-letter codes
+_LANG_MAP = MappingProxyType({
+    'en': 'eng', 'es': 'spa', 'fr': 'fra', 'de': 'deu', 'it': 'ita',
+    'pt': 'por', 'nl': 'nld', 'pl': 'pol', 'ru': 'rus', 'ja': 'jpn',
+    'ko': 'kor', 'zh': 'zho', 'ar': 'ara', 'he': 'heb', 'sv': 'swe',
+    'no': 'nor', 'da': 'dan', 'fi': 'fin', 'tr': 'tur', 'el': 'ell',
+    'hu': 'hun', 'cs': 'ces', 'ro': 'ron', 'th': 'tha', 'vi': 'vie',
+    'hr': 'hrv', 'sr': 'srp', 'bs': 'bos',
+})
+
+# Serialized results of recent searches in --serve mode, least recently used
+# first, as (payload, expiry); new subtitles turn up over time, so results
+# expire after an hour and failed searches after a minute
+_RESULT_CACHE = OrderedDict()
+_RESULT_CACHE_SIZE = 256
+_RESULT_CACHE_TTL = 3600
+_ERROR_CACHE_TTL = 60
+
+_BY_DOWNLOADS = attrgetter('downloads')
+
+# Set once subliminal's cache region has been configured successfully
+_CACHE_CONFIGURED = False
+
+# Provider pool shared across searches and the providers/credentials it was built for
+_POOL = None
+_POOL_CONFIG = None
+
+# Subtitle attributes holding a release name, in order of preference
+_RELEASE_KEYS = ('release_info', 'movie_release_name', 'filename')
 
-def main():
-    if len(sys.argv) < 2:
-        print(json.dumps({"error": "No input provided"}), file=sys.stderr)
-        sys.exit(1)
+
+def _configure_cache():
+    """
+    Configure subliminal's in-memory cache region, once per process.
+
+    Importing subliminal takes hundreds of milliseconds, so this is deferred
+    until a request has parsed and malformed input can be rejected without it.
+    """
+    global _CACHE_CONFIGURED
+    if _CACHE_CONFIGURED:
+        return
+
+    from subliminal import region
+
+    region.configure('dogpile.cache.memory')
+    _CACHE_CONFIGURED = True
+
+
+@lru_cache(maxsize=64)
+def _lang(code: str, strict: bool = False):
+    """
+    Return the babelfish Language for a 2- or 3-letter code.
+
+    Unknown codes fall back to English, or raise ValueError when strict.
+    """
+    from babelfish import Language
 
     try:
-        params = json.loads(sys.argv[1])
-    except json.JSONDecodeError as e:
-        print(json.dumps({"error": f"Invalid JSON: {e}"}), file=sys.stderr)
-        sys.exit(1)
+        return Language(_LANG_MAP.get(code, code))
+    except Exception:
+        if strict:
+            raise ValueError(f"Unknown language code: {code!r}") from None
+        return Language('eng')
+
+
+def _language_codes(params: dict) -> list:
+    """Return the requested language codes, rejecting a "languages" value that isn't a list."""
+    codes = params.get("languages")
+    if codes is None:
+        return [params.get("language", "en")]
+    if not isinstance(codes, list) or not codes:
+        raise ValueError('"languages" must be a non-empty list of language codes')
+    return codes
+
+
+@dataclass(slots=True)
+class SubtitleRow:
+    """One subtitle search result, serialized as a JSON object."""
+    id: str
+    provider: str
+    language: str
+    release: str
+    downloads: int
+    hearing_impaired: bool
+    page_link: str | None
+
+
+def _row(sub) -> SubtitleRow:
+    """Flatten a subliminal Subtitle into a result row."""
+    # Provider-specific fields are plain instance attributes, so read them
+    # straight from __dict__; subtitle_id and hearing_impaired are properties
+    d = sub.__dict__
+    # Get release info from various possible attributes
+    for key in _RELEASE_KEYS:
+        release = d.get(key)
+        if release:
+            break
+    else:
+        release = (d.get('releases') or [''])[0]
+    # Only fall back to a process-local id when the provider gave us nothing
+    sid = getattr(sub, 'subtitle_id', None) or getattr(sub, 'id', None)
+    if not sid:
+        sid = f"{sub.provider_name}:{id(sub)}"
+    return SubtitleRow(
+        id=str(sid),
+        provider=sub.provider_name,
+        language=str(sub.language),
+        release=release,
+        downloads=d.get('download_count') or 0,
+        hearing_impaired=getattr(sub, 'hearing_impaired', False),
+        page_link=d.get('page_link', ''),
+    )
+
+
+@lru_cache(maxsize=None)
+def _pool_class():
+    """
+    Return an AsyncProviderPool that records why providers were discarded.
+
+    subliminal reports any error other than a DiscardingError as "no
+    subtitles", so a timeout would look like an empty, cacheable result.
+    Network errors discard the provider as "transient" instead, while a
+    DiscardingError (bad credentials, download limit, ...) is "permanent".
+    """
+    from xmlrpc.client import ProtocolError
+
+    from subliminal.core import AsyncProviderPool, handle_exception, provider_manager
+    from subliminal.exceptions import DiscardingError
+
+    class Pool(AsyncProviderPool):
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            # {provider: "transient" | "permanent"} for discarded providers
+            self.failures = {}
+            # When permanently discarded providers may be tried again
+            self.retry_at = None
+
+        # Mirrors ProviderPool.list_subtitles_provider from subliminal 2.7.1,
+        # the version pinned in the Dockerfile
+        def list_subtitles_provider(self, provider, video, languages):
+            # Unlike ProviderPool, AsyncProviderPool doesn't skip discarded providers
+            if provider in self.discarded_providers:
+                return None
+            plugin = provider_manager[provider].plugin
+            if not plugin.check(video):
+                return []
+            provider_languages = plugin.check_languages(languages)
+            if not provider_languages:
+                return []
+
+            try:
+                return self[provider].list_subtitles(video, provider_languages)
+            except (OSError, ProtocolError) as e:
+                # requests' RequestException is an OSError too
+                handle_exception(e, f'Provider {provider}')
+                self.failures[provider] = "transient"
+                return None
+            except DiscardingError as e:
+                handle_exception(e, f'Provider {provider}')
+                self.failures[provider] = "permanent"
+                return None
+            except Exception as e:
+                handle_exception(e, f'Provider {provider}')
+                return []
+
+        def list_subtitles_provider_tuple(self, provider, video, languages):
+            # The base class calls ProviderPool.list_subtitles_provider directly
+            return provider, self.list_subtitles_provider(provider, video, languages)
+
+    return Pool
+
+
+def _get_pool(providers: list, provider_configs: dict):
+    """
+    Return the shared provider pool, rebuilding it only when the providers or
+    credentials change, or when discarded providers are due another try.
+
+    Providers are initialized on first use and then kept, so later searches
+    in --serve mode reuse their logins and keep-alive HTTP sessions.
+    """
+    global _POOL, _POOL_CONFIG
+    config = (providers, provider_configs)
+    if (_POOL is None or _POOL_CONFIG != config
+            or (_POOL.retry_at is not None and _POOL.retry_at <= time.monotonic())):
+        _close_pool()
+        _POOL = _pool_class()(providers=providers, provider_configs=provider_configs)
+        _POOL.__enter__()
+        _POOL_CONFIG = config
+    return _POOL
+
+
+def _close_pool():
+    """Terminate the shared provider pool, if one is open."""
+    global _POOL
+    if _POOL is not None:
+        _POOL.__exit__(None, None, None)
+        _POOL = None
+
+
+atexit.register(_close_pool)
+
+
+def _pool_failures(pool) -> dict:
+    """
+    Return {provider: "transient" | "permanent"} for the providers that
+    failed, and schedule the pool to be rebuilt.
+
+    After a network error the pool is closed so the next search starts
+    fresh. Permanently discarded providers stay discarded for
+    _ERROR_CACHE_TTL, so e.g. wrong credentials aren't retried on every search.
+    """
+    failures = dict(pool.failures)
+    if "transient" in failures.values():
+        _close_pool()
+    elif failures and pool.retry_at is None:
+        pool.retry_at = time.monotonic() + _ERROR_CACHE_TTL
+    return failures
+
+
+def _episode(title: str, year, imdb_id, season, episode):
+    """Build the subliminal Episode for one season/episode of a series."""
+    from subliminal.video import Episode
+
+    return Episode(
+        name=title,
+        series=title,
+        season=int(season),
+        episodes=[int(episode)],  # subliminal expects a list of episode numbers
+        year=int(year) if year else None,
+        series_imdb_id=imdb_id,
+    )
+
+
+def _rank(subtitles, limit) -> list:
+    """Turn subtitles into result rows, most downloaded first."""
+    results = [_row(sub) for sub in subtitles]
+
+    # Sort by downloads descending, keeping only the top `limit` rows if requested
+    if limit is not None:
+        return heapq.nlargest(int(limit), results, key=_BY_DOWNLOADS)
+    results.sort(key=_BY_DOWNLOADS, reverse=True)
+    return results
+
+
+def _request(params: dict) -> tuple:
+    """Turn search params into (keys, videos, languages, providers, provider_configs)."""
+    from subliminal.video import Movie
 
     imdb_id = params.get("imdb_id", "")
     title = params.get("title", "")
     year = params.get("year")
     season = params.get("season")
     episode = params.get("episode")
-    language = params.get("language", "en")
+    episodes = params.get("episodes")
 
     # OpenSubtitles credentials (optional)
     os_username = params.get("opensubtitles_username", "")
     os_password = params.get("opensubtitles_password", "")
 
+    # Only pass real IMDb ids (tt...) through to subliminal
+    valid_imdb = imdb_id if imdb_id and imdb_id[:2] == "tt" else None
+
     # Determine if this is a TV show or movie
-    if season is not None and episode is not None:
-        video = Episode(
-            name=title,
-            series=title,
-            season=int(season),
-            episodes=[int(episode)],  # subliminal expects a list of episode numbers
-            year=int(year) if year else None,
-            series_imdb_id=imdb_id if imdb_id and imdb_id.startswith("tt") else None,
-        )
+    keys = None
+    if episodes:
+        keys = [f"S{int(s):02d}E{int(e):02d}" for s, e in episodes]
+        videos = [_episode(title, year, valid_imdb, s, e) for s, e in episodes]
+    elif season is not None and episode is not None:
+        videos = [_episode(title, year, valid_imdb, season, episode)]
     else:
-        video = Movie(
+        videos = [Movie(
             name=title,
             title=title,
             year=int(year) if year else None,
-            imdb_id=imdb_id if imdb_id and imdb_id.startswith("tt") else None,
-        )
-
-    # Parse language - babelfish uses 3-letter ISO 639-2 codes
-    # Map common 2-letter codes to 3-letter codes
-    lang_map = {
-        'en': 'eng', 'es': 'spa', 'fr': 'fra', 'de': 'deu', 'it': 'ita',
-        'pt': 'por', 'nl': 'nld', 'pl': 'pol', 'ru': 'rus', 'ja': 'jpn',
-        'ko': 'kor', 'zh': 'zho', 'ar': 'ara', 'he': 'heb', 'sv': 'swe',
-        'no': 'nor', 'da': 'dan', 'fi': 'fin', 'tr': 'tur', 'el': 'ell',
-        'hu': 'hun', 'cs': 'ces', 'ro': 'ron', 'th': 'tha', 'vi': 'vie',
-        'hr': 'hrv', 'sr': 'srp', 'bs': 'bos',
-    }
-    lang_code = lang_map.get(language, language)
-    try:
-        lang = Language(lang_code)
-    except Exception:
-        lang = Language('eng')
+            imdb_id=valid_imdb,
+        )]
 
-    languages = {lang}
+    # A single "language" falls back to English as it always has, but every
+    # code in a batch "languages" list must be known
+    strict = params.get("languages") is not None
+    languages = {_lang(code, strict) for code in _language_codes(params)}
 
     # Build provider list and config
     # podnapisi works without auth, opensubtitles (.org) requires auth
@@ -84,37 +331,196 @@ def main():
             'password': os_password,
         }
 
+    return keys, videos, languages, providers, provider_configs
+
+
+def handle(params: dict) -> tuple:
+    """
+    Run one subtitle search and return (results, failures), where results
+    are the rows, most downloaded first, and failures maps each provider
+    whose rows are missing to "transient" or "permanent" (see _pool_failures()).
+
+    A batch request may pass "languages": [...] and/or "episodes":
+    [[season, episode], ...]. All videos and languages are searched through
+    one provider pool so provider sessions are shared, and with "episodes"
+    the result is an object of rows keyed by "SxxEyy".
+    """
+    _configure_cache()
+    keys, videos, languages, providers, provider_configs = _request(params)
+    limit = params.get("limit")
+
+    # Query providers concurrently; wall time is the slowest provider, not the sum
+    pool = _get_pool(providers, provider_configs)
+    subtitles = {video: pool.list_subtitles(video, languages) for video in videos}
+    failures = _pool_failures(pool)
+
+    if keys is None:
+        return _rank(subtitles.get(videos[0], ()), limit), failures
+    return {key: _rank(subtitles.get(video, ()), limit) for key, video in zip(keys, videos)}, failures
+
+
+def stream(params: dict, out) -> None:
+    """
+    Run one subtitle search, writing rows to out as each provider finishes.
+
+    Each row is written as {"type": "row", "row": {...}} (plus "episode" for
+    batch requests) and the search ends with {"type": "done", "complete":
+    true}, so a caller can show the fastest provider's results without
+    waiting for the slowest. If a provider failed, the terminator has
+    "complete": false and the failed providers in "failed". Rows are ranked
+    within each provider's batch; "limit" does not apply. serve() ends the
+    stream with {"type": "error", "error": ...} instead if the search fails
+    part-way.
+    """
+    _configure_cache()
+    keys, videos, languages, providers, provider_configs = _request(params)
+    pool = _get_pool(providers, provider_configs)
+
+    def search_provider(provider):
+        # One thread per provider, like AsyncProviderPool, so each provider
+        # is initialized by a single thread. A failed provider is skipped for
+        # the remaining videos but keeps the rows it found for earlier ones.
+        found = []
+        for key, video in zip(keys or [None] * len(videos), videos):
+            subtitles = pool.list_subtitles_provider(provider, video, languages)
+            if subtitles is None:
+                return provider, found, False
+            found.append((key, subtitles))
+        return provider, found, True
+
+    with ThreadPoolExecutor(len(providers)) as executor:
+        for future in as_completed([executor.submit(search_provider, p) for p in providers]):
+            provider, found, ok = future.result()
+            if not ok:
+                pool.discarded_providers.add(provider)
+            for key, subtitles in found:
+                for row in _rank(subtitles, None):
+                    message = {"type": "row", "row": row}
+                    if key is not None:
+                        message["episode"] = key
+                    out.write(_dumpb(message) + b"\n")
+            out.flush()
+
+    failures = _pool_failures(pool)
+    done = {"type": "done", "complete": not failures}
+    if failures:
+        done["failed"] = sorted(failures)
+    out.write(_dumpb(done) + b"\n")
+
+
+def _cache_key(params: dict) -> tuple:
+    """Key a search request on every parameter that affects its results."""
+    return (
+        params.get("imdb_id", ""),
+        params.get("title", ""),
+        params.get("year"),
+        params.get("season"),
+        params.get("episode"),
+        tuple(tuple(e) for e in params.get("episodes") or ()),
+        tuple(_LANG_MAP.get(code, code) for code in _language_codes(params)),
+        bool(params.get("opensubtitles_username") and params.get("opensubtitles_password")),
+        params.get("limit"),
+    )
+
+
+def _cached_search(params: dict) -> bytes:
+    """
+    Return the serialized response for params, answering from _RESULT_CACHE
+    when possible.
+
+    If a provider hit a network error, whatever the others found is returned
+    as {"error": "transient", "retry_after": 1, "results": ...} without being
+    cached, so the caller can retry. Errors and results missing a
+    permanently failed provider (e.g. wrong credentials) are cached briefly
+    so they can't trigger a retry storm against the providers.
+    """
+    try:
+        key = _cache_key(params)
+    except (TypeError, ValueError) as e:
+        # Malformed params can't be keyed, so answer them without caching
+        return _dumpb({"error": str(e)})
+    entry = _RESULT_CACHE.get(key)
+    if entry is not None:
+        payload, expires = entry
+        if expires > time.monotonic():
+            _RESULT_CACHE.move_to_end(key)
+            return payload
+
+    try:
+        results, failures = handle(params)
+    except Exception as e:
+        payload, expires = _dumpb({"error": str(e)}), time.monotonic() + _ERROR_CACHE_TTL
+    else:
+        if "transient" in failures.values():
+            return _dumpb({"error": "transient", "retry_after": 1, "results": results})
+        # Results missing a permanently failed provider are only kept as long as an error
+        ttl = _ERROR_CACHE_TTL if failures else _RESULT_CACHE_TTL
+        payload, expires = _dumpb(results), time.monotonic() + ttl
+
+    _RESULT_CACHE[key] = (payload, expires)
+    _RESULT_CACHE.move_to_end(key)
+    if len(_RESULT_CACHE) > _RESULT_CACHE_SIZE:
+        _RESULT_CACHE.popitem(last=False)
+    return payload
+
+
+def serve():
+    """
+    Answer search requests until stdin closes.
+
+    Each input line is a JSON params object; each output line is the JSON
+    result array, or an {"error": ...} object. Requests with "stream": true
+    are answered incrementally instead (see stream()), and a
+    {"type": "error", ...} line ends such a stream early. Keeping one
+    process alive amortizes the subliminal import and provider setup across
+    searches, and repeated requests are answered from an in-memory LRU of
+    serialized results.
+    """
+    out = sys.stdout.buffer
+    for line in sys.stdin.buffer:
+        line = line.strip()
+        if not line:
+            continue
+        streaming = False
+        try:
+            params = _loads(line)
+            streaming = bool(params.get("stream"))
+            if streaming:
+                stream(params, out)
+                out.flush()
+                continue
+            payload = _cached_search(params)
+        except Exception as e:
+            error = {"type": "error", "error": str(e)} if streaming else {"error": str(e)}
+            payload = _dumpb(error)
+        out.write(payload + b"\n")
+        out.flush()
+
+
+def main():
+    if len(sys.argv) < 2:
+        print(_dumps({"error": "No input provided"}), file=sys.stderr)
+        sys.exit(1)
+
+    if sys.argv[1] == "--serve":
+        serve()
+        return
+
+    try:
+        params = _loads(sys.argv[1])
+    except json.JSONDecodeError as e:
+        print(_dumps({"error": f"Invalid JSON: {e}"}), file=sys.stderr)
+        sys.exit(1)
+
     try:
-        subtitles = list_subtitles([video], languages, providers=providers, provider_configs=provider_configs)
-
-        results = []
-        for sub in subtitles.get(video, []):
-            # Get release info from various possible attributes
-            release = (
-                getattr(sub, 'release_info', '') or
-                getattr(sub, 'movie_release_name', '') or
-                getattr(sub, 'filename', '') or
-                (getattr(sub, 'releases', [''])[0] if hasattr(sub, 'releases') and sub.releases else '')
-            )
-            result = {
-                "id": str(getattr(sub, 'subtitle_id', None) or getattr(sub, 'id', hash(sub))),
-                "provider": sub.provider_name,
-                "language": str(sub.language),
-                "release": release,
-                "downloads": getattr(sub, 'download_count', 0) or 0,
-                "hearing_impaired": getattr(sub, 'hearing_impaired', False),
-                "page_link": getattr(sub, 'page_link', ''),
-            }
-            results.append(result)
-
-        # Sort by downloads descending
-        results.sort(key=lambda x: x.get('downloads', 0), reverse=True)
-
-        print(json.dumps(results))
+        results, _ = handle(params)
     except Exception as e:
-        print(json.dumps({"error": str(e)}), file=sys.stderr)
+        print(_dumps({"error": str(e)}), file=sys.stderr)
         sys.exit(1)
 
+    # Write the encoded bytes directly rather than building and re-encoding a str
+    sys.stdout.buffer.write(_dumpb(results) + b"\n")
+
 
 if __name__ == "__main__":
     main()